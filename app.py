@@ -1,14 +1,19 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import os
 import io
 import csv
+from functools import lru_cache
 
-from user import UserManager
-from expense import ExpenseManager, CATEGORIES
+from user import make_user_manager
+from expense import make_expense_manager, CATEGORIES
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+import matplotlib
+matplotlib.use('Agg')  # headless rendering; no GUI backend per request
+from matplotlib.figure import Figure
 import base64
+from collections import OrderedDict, defaultdict
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'dev-secret')
@@ -19,8 +24,8 @@ def expense_photo():
     # serve the bundled image file from the project root
     return send_file(os.path.join(os.path.dirname(__file__), 'expense_photo.jpeg'))
 
-UM = UserManager()
-EM = ExpenseManager()
+UM = make_user_manager()
+EM = make_expense_manager()
 
 
 def login_required(fn):
@@ -159,39 +164,85 @@ def delete_expense(expense_id):
 @login_required
 def export_expenses():
     user_id = session['user_id']
-    user_exp = EM.list_for_user(user_id)
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=['expense_id', 'user_id', 'amount', 'date', 'category', 'description'])
-    writer.writeheader()
-    for e in user_exp:
-        writer.writerow(e.to_dict())
-    output.seek(0)
-    return send_file(io.BytesIO(output.getvalue().encode('utf-8')),
-                     as_attachment=True,
-                     download_name=f'expenses_user_{user_id}.csv',
-                     mimetype='text/csv')
+
+    def generate():
+        # stream rows as they are produced instead of buffering the whole file;
+        # writing through a TextIOWrapper yields UTF-8 bytes directly, so the
+        # response layer never has to re-encode chunks
+        raw = io.BytesIO()
+        buf = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        writer = csv.writer(buf)
+        writer.writerow(['expense_id', 'user_id', 'amount', 'date', 'category', 'description'])
+        buf.flush()
+        yield raw.getvalue()
+        raw.seek(0)
+        raw.truncate()
+        for e in EM.list_for_user(user_id):
+            writer.writerow(e.csv_row())
+            buf.flush()
+            yield raw.getvalue()
+            raw.seek(0)
+            raw.truncate()
+
+    return Response(stream_with_context(generate()),
+                    mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename=expenses_user_{user_id}.csv'})
+
+
+@lru_cache(maxsize=256)
+def _aggregates(user_id, version):
+    """Monthly and per-category totals for a user, cached until the data changes.
+
+    version is EM.data_version() and is part of the key purely for
+    invalidation: any mutation means a fresh entry, and stale entries age
+    out of the LRU. (File mtimes would miss the SQLite backend's WAL
+    writes, which never touch the database file itself.)
+    """
+    exps = EM.list_for_user(user_id)
+    if not exps:
+        return None
+
+    if len(exps) < 2000:
+        # below pandas' fixed setup cost a plain dict pass is faster
+        monthly_totals = defaultdict(float)
+        cat_totals = defaultdict(float)
+        for e in exps:
+            monthly_totals[e.date[:7]] += e.amount  # YYYY-MM prefix
+            cat_totals[e.category] += e.amount
+        monthly_data = [{'month': m, 'amount': a} for m, a in sorted(monthly_totals.items())]
+        category_data = [{'category': c, 'amount': a} for c, a in cat_totals.items()]
+        return monthly_data, category_data
+
+    # build columns directly: no per-row dicts, no float->str->float round-trip,
+    # and datetime64[D] dates need no pd.to_datetime parsing pass
+    df = pd.DataFrame({
+        'amount': np.fromiter((e.amount for e in exps), dtype=np.float64, count=len(exps)),
+        'date': np.array([e.date for e in exps], dtype='datetime64[D]'),
+        # low-cardinality key: group on integer codes instead of hashing strings.
+        # Categories are inferred from the data — pinning them to CATEGORIES
+        # would drop rows with unknown categories, diverging from the dict
+        # fast path above.
+        'category': pd.Categorical([e.category for e in exps]),
+    })
+    # truncating to month precision groups on integers, avoiding PeriodIndex overhead
+    df['month'] = df['date'].values.astype('datetime64[M]')
+    monthly = df.groupby('month')['amount'].sum().reset_index()
+    monthly['month'] = monthly['month'].dt.strftime('%Y-%m')
+    cat = df.groupby('category', observed=True, sort=False)['amount'].sum().reset_index()
+
+    # convert dataframes to lists of dicts for rendering
+    return monthly.to_dict(orient='records'), cat.to_dict(orient='records')
 
 
 @app.route('/reports')
 @login_required
 def reports():
     user_id = session['user_id']
-    exps = EM.list_for_user(user_id)
-    if not exps:
+    agg = _aggregates(user_id, EM.data_version())
+    if agg is None:
         flash('No expenses to report', 'info')
         return redirect(url_for('expenses'))
-
-    df = pd.DataFrame([e.to_dict() for e in exps])
-    df['amount'] = df['amount'].astype(float)
-    df['date'] = pd.to_datetime(df['date'])
-    df['month'] = df['date'].dt.to_period('M')
-    monthly = df.groupby('month')['amount'].sum().reset_index()
-    monthly['month'] = monthly['month'].dt.strftime('%Y-%m')
-    cat = df.groupby('category')['amount'].sum().reset_index()
-
-    # convert dataframes to lists of dicts for rendering
-    monthly_data = monthly.to_dict(orient='records')
-    category_data = cat.to_dict(orient='records')
+    monthly_data, category_data = agg
 
     return render_template('reports.html', monthly=monthly_data, categories=category_data)
 
@@ -204,43 +255,68 @@ def _plot_to_datauri(fig):
     return f'data:image/png;base64,{data}'
 
 
-@app.route('/visualize')
-@login_required
-def visualize():
-    user_id = session['user_id']
-    exps = EM.list_for_user(user_id)
-    if not exps:
-        flash('No expenses to visualize', 'info')
-        return redirect(url_for('expenses'))
+# rendered (monthly_uri, category_uri) pairs; bounded LRU so stale users age out
+_VIZ_CACHE = OrderedDict()
+_VIZ_CACHE_MAX = 32
 
-    df = pd.DataFrame([e.to_dict() for e in exps])
-    df['amount'] = df['amount'].astype(float)
-    df['date'] = pd.to_datetime(df['date'])
-    df['month'] = df['date'].dt.to_period('M')
 
-    monthly = df.groupby('month')['amount'].sum().reset_index()
-    monthly['month_str'] = monthly['month'].dt.strftime('%Y-%m')
+@lru_cache(maxsize=64)
+def _render_charts(monthly_key, category_key):
+    """Render both charts for the given (label, amount) tuples.
 
-    # monthly bar chart
-    fig1, ax1 = plt.subplots(figsize=(6, 4))
-    ax1.bar(monthly['month_str'], monthly['amount'])
+    Keyed on the aggregate content itself, so identical data — e.g. the
+    same user before and after a no-op save, or two users with matching
+    totals — reuses the encoded PNGs without touching matplotlib.
+    """
+    # monthly bar chart; plain Figure objects skip pyplot's global figure
+    # registry, so nothing leaks and there is no shared state between requests
+    fig1 = Figure(figsize=(6, 4))
+    ax1 = fig1.subplots()
+    ax1.bar([m for m, _ in monthly_key], [a for _, a in monthly_key])
     ax1.set_title('Monthly Spending')
     ax1.set_xlabel('Month')
     ax1.set_ylabel('Total Spending')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
+    ax1.tick_params(axis='x', rotation=45)
+    fig1.tight_layout()
     monthly_uri = _plot_to_datauri(fig1)
-    plt.close(fig1)
 
     # category pie chart
-    cat = df.groupby('category')['amount'].sum()
-    fig2, ax2 = plt.subplots(figsize=(6, 4))
-    cat.plot.pie(autopct='%1.1f%%', ax=ax2)
+    fig2 = Figure(figsize=(6, 4))
+    ax2 = fig2.subplots()
+    ax2.pie([a for _, a in category_key],
+            labels=[c for c, _ in category_key],
+            autopct='%1.1f%%')
     ax2.set_title('Category Distribution')
-    ax2.set_ylabel('')
-    plt.tight_layout()
+    fig2.tight_layout()
     category_uri = _plot_to_datauri(fig2)
-    plt.close(fig2)
+
+    return monthly_uri, category_uri
+
+
+@app.route('/visualize')
+@login_required
+def visualize():
+    user_id = session['user_id']
+    version = EM.data_version()
+    agg = _aggregates(user_id, version)
+    if agg is None:
+        flash('No expenses to visualize', 'info')
+        return redirect(url_for('expenses'))
+
+    cache_key = (user_id, version)
+    if cache_key in _VIZ_CACHE:
+        _VIZ_CACHE.move_to_end(cache_key)
+        monthly_uri, category_uri = _VIZ_CACHE[cache_key]
+        return render_template('visualize.html', monthly_img=monthly_uri, category_img=category_uri)
+
+    monthly_data, category_data = agg
+    monthly_uri, category_uri = _render_charts(
+        tuple((r['month'], r['amount']) for r in monthly_data),
+        tuple((r['category'], r['amount']) for r in category_data))
+
+    _VIZ_CACHE[cache_key] = (monthly_uri, category_uri)
+    if len(_VIZ_CACHE) > _VIZ_CACHE_MAX:
+        _VIZ_CACHE.popitem(last=False)
 
     return render_template('visualize.html', monthly_img=monthly_uri, category_img=category_uri)
 
@@ -10,14 +10,41 @@ expense_id, user_id, amount, date, category, description
 
 import csv
 import os
+import sqlite3
+from bisect import insort
+from contextlib import contextmanager
 from datetime import datetime
 from typing import List, Dict, Optional
 
 EXPENSES_CSV = 'expenses.csv'
+EXPENSES_DB = 'expenses.db'
 
 CATEGORIES = ['Food', 'Transport', 'Rent', 'Utilities', 'Shopping', 'Other']
+# frozenset for membership tests; the list above keeps menu/template ordering
+CATEGORIES_SET = frozenset(CATEGORIES)
+
+FIELDNAMES = ['expense_id', 'user_id', 'amount', 'date', 'category', 'description']
+
+
+def _expense_columns(expenses):
+    """Struct-of-arrays projection of a list of Expenses for analytics.
+
+    Amounts and dates land in typed numpy arrays so downstream aggregation
+    runs over contiguous memory instead of per-object attribute lookups.
+    """
+    import numpy as np  # deferred: only the analytics paths pay for it
+
+    return {
+        'amount': np.fromiter((e.amount for e in expenses), dtype=np.float64, count=len(expenses)),
+        'date': np.array([e.date for e in expenses], dtype='datetime64[D]'),
+        'category': [e.category for e in expenses],
+    }
 
 class Expense:
+    # fixed attribute slots: smaller objects and faster attribute access
+    # than a per-instance __dict__, which matters with many rows in memory
+    __slots__ = ('expense_id', 'user_id', 'amount', 'date', 'category', 'description')
+
     def __init__(self, expense_id: str, user_id: str, amount: float, date: str, category: str, description: str):
         self.expense_id = expense_id
         self.user_id = user_id
@@ -26,6 +53,14 @@ class Expense:
         self.category = category
         self.description = description
 
+    def as_row(self):
+        """Raw-typed row tuple (amount stays a float) for analytics paths."""
+        return (self.expense_id, self.user_id, self.amount, self.date, self.category, self.description)
+
+    def csv_row(self):
+        """Row tuple in FIELDNAMES order with amount formatted for CSV output."""
+        return (self.expense_id, self.user_id, f"{self.amount:.2f}", self.date, self.category, self.description)
+
     def to_dict(self) -> Dict:
         return {
             'expense_id': str(self.expense_id),
@@ -40,44 +75,117 @@ class Expense:
 class ExpenseManager:
     def __init__(self, path: str = EXPENSES_CSV):
         self.path = path
+        self._in_batch = False
+        self._dirty = False
+        self._version = 0  # bumped on every data change; cheap cache-invalidation key
+        self._columns_cache = {}  # user_id -> (version, columns)
         if not os.path.exists(self.path):
             with open(self.path, 'w', newline='', encoding='utf-8') as f:
                 writer = csv.writer(f)
                 writer.writerow(['expense_id', 'user_id', 'amount', 'date', 'category', 'description'])
+        self._load()
 
     def _load_all(self) -> List[Expense]:
         expenses = []
         with open(self.path, newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
+            reader = csv.reader(f)
+            next(reader, None)  # skip header
             for r in reader:
                 try:
-                    expenses.append(Expense(r['expense_id'], r['user_id'], float(r['amount']), r['date'], r['category'], r['description']))
+                    expenses.append(Expense(r[0], r[1], float(r[2]), r[3], r[4], r[5]))
                 except Exception:
                     continue
         return expenses
 
+    @staticmethod
+    def _date_key(e: Expense) -> str:
+        # YYYY-MM-DD sorts lexicographically in chronological order,
+        # so no strptime is needed for ordering
+        return e.date
+
+    def _load(self):
+        """Parse the CSV into memory, rebuild the indexes and remember the mtime."""
+        self.expenses = self._load_all()
+        # Index by composite key for O(1) lookup, and bucket per user in
+        # chronological order so list_for_user never has to scan or sort.
+        self._by_key = {}
+        self._by_user = {}
+        self._max_eid = {}
+        for e in self.expenses:
+            self._by_key[(e.user_id, e.expense_id)] = e
+            insort(self._by_user.setdefault(e.user_id, []), e, key=self._date_key)
+            eid = int(e.expense_id)
+            if eid > self._max_eid.get(e.user_id, 0):
+                self._max_eid[e.user_id] = eid
+        self._mtime = os.stat(self.path).st_mtime_ns
+        self._version += 1
+
+    @contextmanager
+    def batch(self):
+        """Coalesce several edits/deletes into one file rewrite.
+
+        Usage: ``with em.batch(): ...`` — mutations inside the block only
+        mark the cache dirty; the CSV is written once on exit.
+        """
+        if self._in_batch:
+            # nested batch: let the outermost one flush
+            yield
+            return
+        self._in_batch = True
+        self._dirty = False
+        try:
+            yield
+        finally:
+            self._in_batch = False
+            if self._dirty:
+                self._dirty = False
+                self._write_all(self.expenses)
+
+    def _flush(self):
+        """Persist the cached list now, or defer to the enclosing batch()."""
+        if self._in_batch:
+            self._dirty = True
+        else:
+            self._write_all(self.expenses)
+
+    def _get_all(self) -> List[Expense]:
+        """Return the cached expense list, reloading only if the file changed on disk."""
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            self._load()
+        return self.expenses
+
     def _write_all(self, expenses: List[Expense]):
         with open(self.path, 'w', newline='', encoding='utf-8') as f:
-            fieldnames = ['expense_id', 'user_id', 'amount', 'date', 'category', 'description']
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            for e in expenses:
-                writer.writerow(e.to_dict())
+            writer = csv.writer(f)
+            writer.writerow(FIELDNAMES)
+            writer.writerows(e.csv_row() for e in expenses)
+        self.expenses = expenses
+        self._mtime = os.stat(self.path).st_mtime_ns
+        self._version += 1
+
+    def data_version(self) -> int:
+        """Backend-neutral cache-invalidation key: changes whenever the data may have.
+
+        Callers key derived caches on this instead of file mtimes, which
+        the SQLite backend's WAL writes never touch.
+        """
+        self._get_all()  # pick up external edits to the CSV first
+        return self._version
 
     def list_for_user(self, user_id: str) -> List[Expense]:
-        all_exp = self._load_all()
-        user_exp = [e for e in all_exp if e.user_id == str(user_id)]
-        # chronological order by date
-        user_exp.sort(key=lambda x: datetime.strptime(x.date, '%Y-%m-%d'))
-        return user_exp
+        self._get_all()
+        # the bucket is already in chronological order; copy so callers can't mutate it
+        return list(self._by_user.get(str(user_id), []))
 
     def _next_expense_id_for_user(self, user_id: str) -> int:
-        user_exp = [int(e.expense_id) for e in self._load_all() if e.user_id == str(user_id)]
-        return max(user_exp) + 1 if user_exp else 1
+        self._get_all()
+        # ids are never reused after deletion, so the running max is enough
+        return self._max_eid.get(str(user_id), 0) + 1
 
     def add_expense(self, user_id: str, amount: float, date: str, category: str, description: str) -> Expense:
         # Validate category
-        if category not in CATEGORIES:
+        if category not in CATEGORIES_SET:
             raise ValueError('Invalid category')
         # Validate date format
         datetime.strptime(date, '%Y-%m-%d')
@@ -86,54 +194,257 @@ class ExpenseManager:
 
         eid = self._next_expense_id_for_user(user_id)
         exp = Expense(str(eid), str(user_id), amount, date, category, description)
-        all_exp = self._load_all()
-        all_exp.append(exp)
-        self._write_all(all_exp)
+        # Append just the new row; rewriting the whole file is only needed for edit/delete.
+        with open(self.path, 'a', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerow(exp.csv_row())
+        self.expenses.append(exp)
+        self._by_key[(exp.user_id, exp.expense_id)] = exp
+        insort(self._by_user.setdefault(exp.user_id, []), exp, key=self._date_key)
+        self._max_eid[exp.user_id] = eid
+        self._mtime = os.stat(self.path).st_mtime_ns
+        self._version += 1
         return exp
 
+    def columns_for_user(self, user_id: str):
+        """Cached columnar view of a user's expenses, rebuilt after mutations."""
+        self._get_all()
+        cached = self._columns_cache.get(str(user_id))
+        if cached is not None and cached[0] == self._version:
+            return cached[1]
+        cols = _expense_columns(self._by_user.get(str(user_id), []))
+        self._columns_cache[str(user_id)] = (self._version, cols)
+        return cols
+
     def find_expense(self, user_id: str, expense_id: str) -> Optional[Expense]:
-        for e in self._load_all():
-            if e.user_id == str(user_id) and e.expense_id == str(expense_id):
-                return e
-        return None
+        self._get_all()
+        return self._by_key.get((str(user_id), str(expense_id)))
 
     def edit_expense(self, user_id: str, expense_id: str, **kwargs) -> Expense:
-        all_exp = self._load_all()
-        found = False
-        for e in all_exp:
-            if e.user_id == str(user_id) and e.expense_id == str(expense_id):
-                found = True
-                if 'amount' in kwargs:
-                    if float(kwargs['amount']) <= 0:
-                        raise ValueError('Amount must be positive')
-                    e.amount = float(kwargs['amount'])
-                if 'date' in kwargs:
-                    datetime.strptime(kwargs['date'], '%Y-%m-%d')
-                    e.date = kwargs['date']
-                if 'category' in kwargs:
-                    if kwargs['category'] not in CATEGORIES:
-                        raise ValueError('Invalid category')
-                    e.category = kwargs['category']
-                if 'description' in kwargs:
-                    e.description = kwargs['description']
-                break
-        if not found:
+        self._get_all()
+        e = self._by_key.get((str(user_id), str(expense_id)))
+        if e is None:
             raise KeyError('Expense not found')
-        self._write_all(all_exp)
+        # validate everything before mutating the cached object
+        if 'amount' in kwargs and float(kwargs['amount']) <= 0:
+            raise ValueError('Amount must be positive')
+        if 'date' in kwargs:
+            datetime.strptime(kwargs['date'], '%Y-%m-%d')
+        if 'category' in kwargs and kwargs['category'] not in CATEGORIES_SET:
+            raise ValueError('Invalid category')
+        if 'amount' in kwargs:
+            e.amount = float(kwargs['amount'])
+        if 'date' in kwargs:
+            # re-place in the chronological bucket
+            bucket = self._by_user[e.user_id]
+            bucket.remove(e)
+            e.date = kwargs['date']
+            insort(bucket, e, key=self._date_key)
+        if 'category' in kwargs:
+            e.category = kwargs['category']
+        if 'description' in kwargs:
+            e.description = kwargs['description']
+        self._flush()
         return e
 
     def delete_expense(self, user_id: str, expense_id: str) -> bool:
-        all_exp = self._load_all()
-        new_list = [e for e in all_exp if not (e.user_id == str(user_id) and e.expense_id == str(expense_id))]
-        if len(new_list) == len(all_exp):
+        self._get_all()
+        e = self._by_key.pop((str(user_id), str(expense_id)), None)
+        if e is None:
             return False
-        self._write_all(new_list)
+        self.expenses.remove(e)
+        self._by_user[e.user_id].remove(e)
+        self._flush()
         return True
 
     def export_user_expenses(self, user_id: str, out_path: str):
         user_exp = self.list_for_user(user_id)
         with open(out_path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=['expense_id', 'user_id', 'amount', 'date', 'category', 'description'])
-            writer.writeheader()
-            for e in user_exp:
-                writer.writerow(e.to_dict())
+            writer = csv.writer(f)
+            writer.writerow(FIELDNAMES)
+            writer.writerows(e.csv_row() for e in user_exp)
+
+
+class SQLiteExpenseManager:
+    """Drop-in replacement for ExpenseManager backed by SQLite.
+
+    The data model is relational — composite (user_id, expense_id) key,
+    per-user listings ordered by date — so an indexed table beats CSV scans
+    and rewrites. Opt in with EXPENSE_BACKEND=sqlite; a fresh database is
+    seeded once from expenses.csv if that file exists.
+    """
+
+    def __init__(self, path: str = EXPENSES_DB, csv_path: str = EXPENSES_CSV):
+        self.path = path
+        self._version = 0  # bumped on every data change; cheap cache-invalidation key
+        self._columns_cache = {}  # user_id -> (version, columns)
+        fresh = not os.path.exists(self.path)
+        # check_same_thread off: Flask's dev server handles requests on worker threads
+        self.db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS expenses ('
+            ' user_id INTEGER NOT NULL,'
+            ' expense_id INTEGER NOT NULL,'
+            ' amount REAL NOT NULL,'
+            ' date TEXT NOT NULL,'
+            ' category TEXT NOT NULL,'
+            " description TEXT NOT NULL DEFAULT '',"
+            ' PRIMARY KEY (user_id, expense_id))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses(user_id, date)')
+        if fresh and os.path.exists(csv_path):
+            self._migrate_from_csv(csv_path)
+
+    def _migrate_from_csv(self, csv_path: str):
+        """One-shot import of an existing expenses.csv into the new database."""
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            next(reader, None)  # skip header
+            rows = []
+            for r in reader:
+                try:
+                    rows.append((int(r[1]), int(r[0]), float(r[2]), r[3], r[4], r[5]))
+                except Exception:
+                    continue
+        self.db.executemany(
+            'INSERT OR IGNORE INTO expenses(user_id, expense_id, amount, date, category, description)'
+            ' VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    @staticmethod
+    def _to_expense(row) -> Expense:
+        return Expense(str(row[1]), str(row[0]), row[2], row[3], row[4], row[5])
+
+    @staticmethod
+    def _coerce_id(value) -> Optional[int]:
+        """int() an id, or None for non-numeric input (e.g. a typo'd prompt entry).
+
+        The CSV manager answers bad ids with a failed dict lookup; coercing
+        here keeps find/edit/delete behaviour identical across backends
+        instead of leaking ValueError out of int().
+        """
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def list_for_user(self, user_id: str) -> List[Expense]:
+        cur = self.db.execute(
+            'SELECT user_id, expense_id, amount, date, category, description'
+            ' FROM expenses WHERE user_id = ? ORDER BY date', (int(user_id),))
+        return [self._to_expense(r) for r in cur]
+
+    def data_version(self) -> int:
+        """Backend-neutral cache-invalidation key: changes whenever the data may have."""
+        return self._version
+
+    def columns_for_user(self, user_id: str):
+        """Cached columnar view of a user's expenses, rebuilt after mutations."""
+        cached = self._columns_cache.get(str(user_id))
+        if cached is not None and cached[0] == self._version:
+            return cached[1]
+        cols = _expense_columns(self.list_for_user(user_id))
+        self._columns_cache[str(user_id)] = (self._version, cols)
+        return cols
+
+    @contextmanager
+    def batch(self):
+        """Coalesce several mutations into one transaction.
+
+        Mirror of the CSV manager's batch(): inside the block each
+        statement joins one transaction instead of autocommitting, with a
+        single COMMIT on exit (ROLLBACK if the block raises).
+        """
+        if self.db.in_transaction:
+            # nested batch: let the outermost one commit
+            yield
+            return
+        self.db.execute('BEGIN')
+        try:
+            yield
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+
+    def _next_expense_id_for_user(self, user_id: str) -> int:
+        cur = self.db.execute('SELECT COALESCE(MAX(expense_id), 0) + 1 FROM expenses WHERE user_id = ?',
+                              (int(user_id),))
+        return cur.fetchone()[0]
+
+    def add_expense(self, user_id: str, amount: float, date: str, category: str, description: str) -> Expense:
+        if category not in CATEGORIES_SET:
+            raise ValueError('Invalid category')
+        datetime.strptime(date, '%Y-%m-%d')
+        if amount <= 0:
+            raise ValueError('Amount must be positive')
+
+        eid = self._next_expense_id_for_user(user_id)
+        self.db.execute(
+            'INSERT INTO expenses(user_id, expense_id, amount, date, category, description)'
+            ' VALUES (?, ?, ?, ?, ?, ?)',
+            (int(user_id), eid, float(amount), date, category, description))
+        self._version += 1
+        return Expense(str(eid), str(user_id), amount, date, category, description)
+
+    def find_expense(self, user_id: str, expense_id: str) -> Optional[Expense]:
+        uid, eid = self._coerce_id(user_id), self._coerce_id(expense_id)
+        if uid is None or eid is None:
+            return None
+        cur = self.db.execute(
+            'SELECT user_id, expense_id, amount, date, category, description'
+            ' FROM expenses WHERE user_id = ? AND expense_id = ?',
+            (uid, eid))
+        row = cur.fetchone()
+        return self._to_expense(row) if row else None
+
+    def edit_expense(self, user_id: str, expense_id: str, **kwargs) -> Expense:
+        uid, eid = self._coerce_id(user_id), self._coerce_id(expense_id)
+        if uid is None or eid is None:
+            raise KeyError('Expense not found')
+        if 'amount' in kwargs and float(kwargs['amount']) <= 0:
+            raise ValueError('Amount must be positive')
+        if 'date' in kwargs:
+            datetime.strptime(kwargs['date'], '%Y-%m-%d')
+        if 'category' in kwargs and kwargs['category'] not in CATEGORIES_SET:
+            raise ValueError('Invalid category')
+        sets = []
+        params = []
+        for field in ('amount', 'date', 'category', 'description'):
+            if field in kwargs:
+                sets.append(f'{field} = ?')
+                params.append(float(kwargs[field]) if field == 'amount' else kwargs[field])
+        if sets:
+            cur = self.db.execute(
+                f"UPDATE expenses SET {', '.join(sets)} WHERE user_id = ? AND expense_id = ?",
+                (*params, uid, eid))
+            if cur.rowcount == 0:
+                raise KeyError('Expense not found')
+            self._version += 1
+        e = self.find_expense(user_id, expense_id)
+        if e is None:
+            raise KeyError('Expense not found')
+        return e
+
+    def delete_expense(self, user_id: str, expense_id: str) -> bool:
+        uid, eid = self._coerce_id(user_id), self._coerce_id(expense_id)
+        if uid is None or eid is None:
+            return False
+        cur = self.db.execute('DELETE FROM expenses WHERE user_id = ? AND expense_id = ?',
+                              (uid, eid))
+        if cur.rowcount > 0:
+            self._version += 1
+            return True
+        return False
+
+    def export_user_expenses(self, user_id: str, out_path: str):
+        user_exp = self.list_for_user(user_id)
+        with open(out_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDNAMES)
+            writer.writerows(e.csv_row() for e in user_exp)
+
+
+def make_expense_manager():
+    """Pick the storage backend: CSV by default, SQLite when EXPENSE_BACKEND=sqlite."""
+    if os.environ.get('EXPENSE_BACKEND') == 'sqlite':
+        return SQLiteExpenseManager()
+    return ExpenseManager()
@@ -9,16 +9,51 @@ main.py
 Command-line interface that uses UserManager and ExpenseManager.
 """
 
+import os
+import re
 import sys
 from getpass import getpass
 from datetime import datetime
-import pandas as pd
-import matplotlib.pyplot as plt
 
-from user import UserManager
-from expense import ExpenseManager, CATEGORIES
+from user import make_user_manager
+from expense import ExpenseManager, make_expense_manager, CATEGORIES
 
 
+# (user_id -> (manager version, monthly totals, category totals)) shared by
+# REPORTS and VISUALIZE so the second command reuses the first one's groupbys
+_REPORT_CACHE = {}
+
+
+def _report_frames(em, user_id):
+    """Monthly and per-category totals for a user, rebuilt only after a mutation."""
+    import pandas as pd  # deferred so LIST/ADD sessions never pay the import
+
+    version = em.data_version()
+    cached = _REPORT_CACHE.get(user_id)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+    # the manager serves a columnar (struct-of-arrays) view: typed arrays for
+    # amount and date, no per-row dicts or attribute walks here
+    cols = em.columns_for_user(user_id)
+    df = pd.DataFrame({
+        'amount': cols['amount'],
+        'date': cols['date'],
+        # low-cardinality key: group on integer codes instead of hashing strings.
+        # Categories are inferred from the data — pinning them to CATEGORIES
+        # would map unknown values to NaN and drop those rows from the totals.
+        'category': pd.Categorical(cols['category']),
+    })
+    df['month'] = df['date'].dt.to_period('M')
+    monthly = df.groupby('month')['amount'].sum().reset_index()
+    monthly['month'] = monthly['month'].dt.strftime('%Y-%m')
+    cat = df.groupby('category', observed=True)['amount'].sum().reset_index()
+    _REPORT_CACHE[user_id] = (version, monthly, cat)
+    return monthly, cat
+
+
+# the numbered category menu never changes; format it once at import
+CATEGORY_MENU = '\n'.join(f'{i}. {c}' for i, c in enumerate(CATEGORIES, 1))
+
 PASSWORD_POLICY = {
     'min_len': 8,
     'uppercase': True,
@@ -27,21 +62,27 @@ PASSWORD_POLICY = {
 }
 
 
+# precompiled character-class scans; sre runs them in C with no per-char frames
+_HAS_UPPER = re.compile(r'[A-Z]').search
+_HAS_LOWER = re.compile(r'[a-z]').search
+_HAS_DIGIT = re.compile(r'[0-9]').search
+
+
 def validate_password_strength(pw: str) -> bool:
     if len(pw) < PASSWORD_POLICY['min_len']:
         return False
-    if PASSWORD_POLICY['uppercase'] and not any(c.isupper() for c in pw):
+    if PASSWORD_POLICY['uppercase'] and not _HAS_UPPER(pw):
         return False
-    if PASSWORD_POLICY['lowercase'] and not any(c.islower() for c in pw):
+    if PASSWORD_POLICY['lowercase'] and not _HAS_LOWER(pw):
         return False
-    if PASSWORD_POLICY['digits'] and not any(c.isdigit() for c in pw):
+    if PASSWORD_POLICY['digits'] and not _HAS_DIGIT(pw):
         return False
     return True
 
 
 def main_menu():
-    um = UserManager()
-    em = ExpenseManager()
+    um = make_user_manager()
+    em = make_expense_manager()
 
     while True:
         print('\n--- Personal Expense Manager ---')
@@ -62,16 +103,17 @@ def main_menu():
 
         elif choice == '2':
             username = input('Choose a username: ').strip()
-            if um.get_user_by_username(username):
-                print('Username already taken. Try another.')
-                continue
             password = getpass('Choose a password: ')
             if not validate_password_strength(password):
                 print('Password does not meet policy: min 8 chars, include uppercase, lowercase, and digit.')
                 continue
             try:
+                # create_user does the duplicate check atomically and raises
+                # ValueError, so no separate lookup beforehand
                 new_user = um.create_user(username, password)
                 print(f'Account created. Your user id is {new_user.user_id}')
+            except ValueError:
+                print('Username already taken. Try another.')
             except Exception as e:
                 print('Failed to create account:', e)
 
@@ -93,11 +135,13 @@ def transaction_menu(user, em: ExpenseManager):
             if not exps:
                 print('No expenses found.')
             else:
-                print(f"Expenses for {user.username} (user_id={user.user_id}):")
-                print('{:>8} | {:>10} | {:>10} | {:>12} | {:<30}'.format('ID', 'Amount', 'Date', 'Category', 'Description'))
-                print('-'*80)
-                for e in exps:
-                    print('{:>8} | {:>10} | {:>10} | {:>12} | {:<30}'.format(e.expense_id, f"{e.amount:.2f}", e.date, e.category, e.description[:30]))
+                # build all lines and write once: one syscall instead of one per row
+                header = (f"Expenses for {user.username} (user_id={user.user_id}):\n"
+                          f"{'ID':>8} | {'Amount':>10} | {'Date':>10} | {'Category':>12} | {'Description':<30}\n"
+                          + '-' * 80 + '\n')
+                rows = [f"{e.expense_id:>8} | {e.amount:>10.2f} | {e.date:>10} | {e.category:>12} | {e.description[:30]:<30}\n"
+                        for e in exps]
+                sys.stdout.write(header + ''.join(rows))
 
         elif cmd == 'ADD':
             try:
@@ -105,9 +149,7 @@ def transaction_menu(user, em: ExpenseManager):
                 date = input('Date (YYYY-MM-DD): ').strip()
                 # validate date
                 datetime.strptime(date, '%Y-%m-%d')
-                print('Choose category from:')
-                for i, c in enumerate(CATEGORIES, 1):
-                    print(f'{i}. {c}')
+                print('Choose category from:\n' + CATEGORY_MENU)
                 cat_idx = int(input('Category number: ').strip())
                 if not 1 <= cat_idx <= len(CATEGORIES):
                     print('Invalid category selection')
@@ -130,9 +172,7 @@ def transaction_menu(user, em: ExpenseManager):
             print('Leave a field empty to keep current value.')
             new_amount = input(f'Amount ({found.amount}): ').strip()
             new_date = input(f'Date ({found.date}): ').strip()
-            print('Categories:')
-            for i, c in enumerate(CATEGORIES, 1):
-                print(f'{i}. {c}')
+            print('Categories:\n' + CATEGORY_MENU)
             new_cat = input(f'Category ({found.category}) number: ').strip()
             new_desc = input(f'Description ({found.description}): ').strip()
             kwargs = {}
@@ -172,17 +212,9 @@ def transaction_menu(user, em: ExpenseManager):
             if not exps:
                 print('No expenses to report.')
                 continue
-            df = pd.DataFrame([e.to_dict() for e in exps])
-            df['amount'] = df['amount'].astype(float)
-            df['date'] = pd.to_datetime(df['date'])
-            # Total spending per month
-            df['month'] = df['date'].dt.to_period('M')
-            monthly = df.groupby('month')['amount'].sum().reset_index()
-            monthly['month'] = monthly['month'].dt.strftime('%Y-%m')
+            monthly, cat = _report_frames(em, user.user_id)
             print('\nTotal spending per month:')
             print(monthly.to_string(index=False))
-            # Category-wise distribution
-            cat = df.groupby('category')['amount'].sum().reset_index()
             print('\nCategory-wise distribution:')
             print(cat.to_string(index=False))
 
@@ -191,30 +223,40 @@ def transaction_menu(user, em: ExpenseManager):
             if not exps:
                 print('No expenses to visualize.')
                 continue
-            df = pd.DataFrame([e.to_dict() for e in exps])
-            df['amount'] = df['amount'].astype(float)
-            df['date'] = pd.to_datetime(df['date'])
-            df['month'] = df['date'].dt.to_period('M')
-            monthly = df.groupby('month')['amount'].sum().reset_index()
-            monthly['month_str'] = monthly['month'].dt.strftime('%Y-%m')
+            import matplotlib
+            headless = bool(os.environ.get('EXPENSE_HEADLESS'))
+            if headless:
+                # no GUI: render charts with Agg and save them instead of showing windows
+                matplotlib.use('Agg')
+            import matplotlib.pyplot as plt
+
+            monthly, cat = _report_frames(em, user.user_id)
             # Bar chart for monthly
-            plt.figure()
-            plt.bar(monthly['month_str'], monthly['amount'])
-            plt.title('Monthly Spending')
-            plt.xlabel('Month')
-            plt.ylabel('Total Spending')
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            plt.show()
+            fig, ax = plt.subplots()
+            ax.bar(monthly['month'], monthly['amount'])
+            ax.set_title('Monthly Spending')
+            ax.set_xlabel('Month')
+            ax.set_ylabel('Total Spending')
+            ax.tick_params(axis='x', rotation=45)
+            fig.tight_layout()
+            if headless:
+                fig.savefig('monthly.png')
+                print('Saved monthly.png')
+            else:
+                plt.show()
+            plt.close(fig)  # drop it from pyplot's registry; repeated VISUALIZEs stay flat
 
             # Pie chart for categories
-            cat = df.groupby('category')['amount'].sum()
-            plt.figure()
-            cat.plot.pie(autopct='%1.1f%%')
-            plt.title('Category Distribution')
-            plt.ylabel('')
-            plt.tight_layout()
-            plt.show()
+            fig, ax = plt.subplots()
+            ax.pie(cat['amount'], labels=cat['category'], autopct='%1.1f%%')
+            ax.set_title('Category Distribution')
+            fig.tight_layout()
+            if headless:
+                fig.savefig('category.png')
+                print('Saved category.png')
+            else:
+                plt.show()
+            plt.close(fig)
 
         elif cmd == 'EXPORT':
             out = input('Output CSV filename (e.g., my_expenses.csv): ').strip()
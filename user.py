@@ -1,18 +1,28 @@
 # -------------------- user.py --------------------
 """
 user.py
-Manages user creation and authentication. Uses salted SHA-256 for password storage.
+Manages user creation and authentication. Uses salted PBKDF2-HMAC-SHA256.
 users.csv fields: user_id,username,hashed_password
-hashed_password format stored: salt$sha256_hex
+hashed_password format stored: salt$iterations$pbkdf2_hex
+(legacy salt$sha256_hex entries still verify and are upgraded on login)
 """
 
 import csv
 import os
 import hashlib
+import hmac
 import secrets
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 USERS_CSV = 'users.csv'
+USERS_DB = 'users.db'
+
+# PBKDF2 work factor. Recorded inside every stored hash, so lowering or
+# raising it for a deployment never invalidates existing credentials —
+# out-of-date hashes are upgraded at the next successful login.
+PBKDF2_ITERATIONS = int(os.environ.get('PBKDF2_ITERATIONS', '100000'))
 
 class User:
     def __init__(self, user_id: str, username: str, hashed_password: str):
@@ -29,21 +39,73 @@ class UserManager:
             with open(self.path, 'w', newline='', encoding='utf-8') as f:
                 writer = csv.writer(f)
                 writer.writerow(['user_id', 'username', 'hashed_password'])
+        self._load()
+
+    def _load(self):
+        """Parse the CSV once and build the lookup indexes."""
+        self.users = self._load_all_users()
+        self._by_username = {u.username: u for u in self.users}
+        self._by_id = {u.user_id: u for u in self.users}
+        self._max_id = max((int(u.user_id) for u in self.users), default=0)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def _refresh(self):
+        """Reload only if the file changed on disk."""
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            self._load()
+
+    def _save(self):
+        """Rewrite users.csv from the cached list.
+
+        Rows go through writerows in one C-level loop, and the file is
+        written to a temp path then atomically renamed so a concurrent
+        reader never sees a truncated users.csv.
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['user_id', 'username', 'hashed_password'])
+            writer.writerows((u.user_id, u.username, u.hashed_password) for u in self.users)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
 
-    def _hash_password(self, password: str, salt: Optional[str] = None) -> str:
-        """Return salted sha256 in the form salt$hash"""
+    def _hash_password(self, password: str, salt: Optional[str] = None,
+                       iterations: int = PBKDF2_ITERATIONS) -> str:
+        """Return salted PBKDF2 in the form salt$iterations$hash"""
         if salt is None:
             salt = secrets.token_hex(16)
+        dk = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('ascii'), iterations)
+        return f"{salt}${iterations}${dk.hex()}"
+
+    @staticmethod
+    def _legacy_hash(password: str, salt: str) -> str:
+        """Pre-PBKDF2 salted sha256, kept so old hashes keep verifying."""
         h = hashlib.sha256()
-        h.update((salt + password).encode('utf-8'))
+        h.update(salt.encode('ascii'))
+        h.update(password.encode('utf-8'))
         return f"{salt}${h.hexdigest()}"
 
+    @staticmethod
+    def _needs_rehash(stored: str) -> bool:
+        parts = stored.split('$')
+        return len(parts) != 3 or parts[1] != str(PBKDF2_ITERATIONS)
+
     def _verify_password(self, password: str, stored: str) -> bool:
-        try:
-            salt, h = stored.split('$')
-        except ValueError:
+        parts = stored.split('$')
+        if len(parts) == 3:
+            salt, iters, _ = parts
+            try:
+                iterations = int(iters)
+            except ValueError:
+                return False
+            computed = self._hash_password(password, salt, iterations)
+        elif len(parts) == 2:
+            computed = self._legacy_hash(password, parts[0])
+        else:
             return False
-        return self._hash_password(password, salt) == stored
+        # constant-time compare so mismatch position leaks nothing
+        return hmac.compare_digest(computed, stored)
 
     def _load_all_users(self) -> list:
         users = []
@@ -54,10 +116,8 @@ class UserManager:
         return users
 
     def get_user_by_username(self, username: str) -> Optional[User]:
-        for u in self._load_all_users():
-            if u.username == username:
-                return u
-        return None
+        self._refresh()
+        return self._by_username.get(username)
 
     def create_user(self, username: str, password: str) -> User:
         # Basic username existence check
@@ -65,24 +125,163 @@ class UserManager:
             raise ValueError('Username already exists')
 
         # Generate a new user_id (sequential integer as string)
-        users = self._load_all_users()
-        if not users:
-            next_id = 1
-        else:
-            ids = [int(u.user_id) for u in users]
-            next_id = max(ids) + 1
+        next_id = self._max_id + 1
         hashed = self._hash_password(password)
         user = User(str(next_id), username, hashed)
 
-        # Append to CSV immediately
+        # Append to CSV immediately and update the indexes in place
         with open(self.path, 'a', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             writer.writerow([user.user_id, user.username, user.hashed_password])
+        self.users.append(user)
+        self._by_username[user.username] = user
+        self._by_id[user.user_id] = user
+        self._max_id = next_id
+        self._mtime = os.stat(self.path).st_mtime_ns
 
         return user
 
+    def create_users_batch(self, pairs) -> list:
+        """Create many accounts with one file append and a single fsync.
+
+        pairs is an iterable of (username, password). The whole batch is
+        validated first; duplicates (against existing users or within the
+        batch) raise ValueError before anything is written.
+        """
+        pairs = list(pairs)
+        self._refresh()
+        seen = set()
+        for username, _ in pairs:
+            if username in self._by_username or username in seen:
+                raise ValueError(f'Username already exists: {username}')
+            seen.add(username)
+
+        # hashing dominates batch creation and runs in OpenSSL with the GIL
+        # released, so a thread pool spreads it across cores with no pickling
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+            hashes = list(pool.map(self._hash_password, (password for _, password in pairs)))
+
+        next_id = self._max_id
+        new_users = []
+        for (username, _), hashed in zip(pairs, hashes):
+            next_id += 1
+            new_users.append(User(str(next_id), username, hashed))
+
+        # one buffered append and one durability point for the whole batch
+        with open(self.path, 'a', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows((u.user_id, u.username, u.hashed_password) for u in new_users)
+            f.flush()
+            os.fsync(f.fileno())
+
+        for u in new_users:
+            self.users.append(u)
+            self._by_username[u.username] = u
+            self._by_id[u.user_id] = u
+        self._max_id = next_id
+        self._mtime = os.stat(self.path).st_mtime_ns
+        return new_users
+
+    def _persist_rehash(self, user: User):
+        """Write an upgraded hash back to storage."""
+        self._save()
+
     def authenticate(self, username: str, password: str) -> Optional[User]:
         user = self.get_user_by_username(username)
         if user and self._verify_password(password, user.hashed_password):
+            if self._needs_rehash(user.hashed_password):
+                # migrate-on-login: re-hash at the current parameters while
+                # the plaintext is briefly in hand
+                user.hashed_password = self._hash_password(password)
+                self._persist_rehash(user)
             return user
         return None
+
+
+class SQLiteUserManager(UserManager):
+    """UserManager backed by SQLite instead of CSV.
+
+    Inherits the hashing/verification and authenticate() logic; lookups go
+    through an indexed table, and the UNIQUE constraint on username makes
+    duplicate checks race-free. Opt in with EXPENSE_BACKEND=sqlite; a fresh
+    database is seeded once from users.csv if that file exists.
+    """
+
+    def __init__(self, path: str = USERS_DB, csv_path: str = USERS_CSV):
+        self.path = path
+        fresh = not os.path.exists(self.path)
+        self.db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS users ('
+            ' user_id INTEGER PRIMARY KEY,'
+            ' username TEXT NOT NULL UNIQUE,'
+            ' hashed_password TEXT NOT NULL)')
+        if fresh and os.path.exists(csv_path):
+            self._migrate_from_csv(csv_path)
+
+    def _migrate_from_csv(self, csv_path: str):
+        """One-shot import of an existing users.csv into the new database."""
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            next(reader, None)  # skip header
+            rows = [(int(r[0]), r[1], r[2]) for r in reader if len(r) >= 3]
+        self.db.executemany(
+            'INSERT OR IGNORE INTO users(user_id, username, hashed_password) VALUES (?, ?, ?)', rows)
+
+    def get_user_by_username(self, username: str) -> Optional[User]:
+        cur = self.db.execute(
+            'SELECT user_id, username, hashed_password FROM users WHERE username = ?', (username,))
+        row = cur.fetchone()
+        return User(str(row[0]), row[1], row[2]) if row else None
+
+    def create_user(self, username: str, password: str) -> User:
+        hashed = self._hash_password(password)
+        try:
+            cur = self.db.execute(
+                'INSERT INTO users(username, hashed_password) VALUES (?, ?)', (username, hashed))
+        except sqlite3.IntegrityError:
+            raise ValueError('Username already exists')
+        return User(str(cur.lastrowid), username, hashed)
+
+    def create_users_batch(self, pairs) -> list:
+        """Create many accounts with one hashing pass and one INSERT batch.
+
+        Same contract as the CSV version: the whole batch is validated
+        first and duplicates raise ValueError before anything is written;
+        the inserts run in a single transaction so a losing race against a
+        concurrent insert rolls the batch back instead of half-applying it.
+        """
+        pairs = list(pairs)
+        seen = set()
+        for username, _ in pairs:
+            if self.get_user_by_username(username) is not None or username in seen:
+                raise ValueError(f'Username already exists: {username}')
+            seen.add(username)
+
+        # hashing dominates batch creation and runs in OpenSSL with the GIL
+        # released, so a thread pool spreads it across cores with no pickling
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+            hashes = list(pool.map(self._hash_password, (password for _, password in pairs)))
+
+        self.db.execute('BEGIN')
+        try:
+            self.db.executemany(
+                'INSERT INTO users(username, hashed_password) VALUES (?, ?)',
+                [(username, hashed) for (username, _), hashed in zip(pairs, hashes)])
+        except sqlite3.IntegrityError:
+            self.db.execute('ROLLBACK')
+            raise ValueError('Username already exists')
+        self.db.execute('COMMIT')
+        return [self.get_user_by_username(username) for username, _ in pairs]
+
+    def _persist_rehash(self, user: User):
+        self.db.execute('UPDATE users SET hashed_password = ? WHERE user_id = ?',
+                        (user.hashed_password, int(user.user_id)))
+
+
+def make_user_manager():
+    """Pick the storage backend: CSV by default, SQLite when EXPENSE_BACKEND=sqlite."""
+    if os.environ.get('EXPENSE_BACKEND') == 'sqlite':
+        return SQLiteUserManager()
+    return UserManager()